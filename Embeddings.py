@@ -1,74 +1,232 @@
 import os
 import time
-from dotenv import load_dotenv
+import sqlite3
+import asyncio
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from pinecone import Pinecone, ServerlessSpec
+from pinecone.grpc import PineconeGRPC
 from langchain_pinecone import PineconeVectorStore
 from langchain_community.document_loaders import TextLoader
-from langchain_google_genai import GoogleGenerativeAIEmbeddings 
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from config import settings
+from policy_categories import classify_policy_page
 
 # --- Credentials & Configuration ---
-load_dotenv()
-os.environ["GOOGLE_API_KEY"] = os.environ.get("GOOGLE_API_KEY")
-INDEX_NAME = os.environ.get('INDEX_NAME', 'hr-vector-search-index')
+os.environ["GOOGLE_API_KEY"] = settings.google_api_key
+INDEX_NAME = settings.index_name
+EMBEDDING_MODEL = "models/text-embedding-004"
 EMBEDDING_DIMENSION = 768
+EMBED_BATCH_SIZE = 1000     # Chunks per embedding API call
+UPSERT_BATCH_SIZE = 100     # Pinecone's recommended upsert batch size
+MAX_CONCURRENT_UPSERTS = 16 # In-flight gRPC upsert requests
+DELETE_BATCH_SIZE = 1000    # Pinecone's limit on IDs per delete call
+EMBEDDING_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".emb_cache.sqlite")
 
 # --- Initialize Models ---
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
 
-# --- Initialize Pinecone ---
-pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))
+# --- Folder containing the .txt files ---
+folder_path = r"C:\Users\alokm\OneDrive\Documents\Machine Learning\Assignment\HR Chatbot\Data\Pages_Text"
+
+# --- Splitting (runs in worker processes) ---
+text_splitter = None
 
-# Check if the index exists
-if INDEX_NAME not in pc.list_indexes().names():
-    print(f"Index '{INDEX_NAME}' does not exist. Creating it now...")
-    spec = ServerlessSpec(
-        cloud="aws",
-        region="us-east-1"
+def init_text_splitter():
+    """Build the text splitter once per process."""
+    global text_splitter
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        add_start_index=True,
     )
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=EMBEDDING_DIMENSION,
-        metric="cosine",
-        spec=spec
+
+def split_file(file_path):
+    """Load a single txt file and split it into chunks tagged with their policy category."""
+    # Pool workers build it in their initializer; direct callers get it on first use
+    if text_splitter is None:
+        init_text_splitter()
+    loader = TextLoader(file_path, encoding="utf-8")  # UTF-8 encoding for Korean text
+    splits = text_splitter.split_documents(loader.load())
+    metadata = {"source": os.path.basename(file_path), "category": classify_policy_page(file_path)}
+    for split in splits:
+        split.metadata.update(metadata)
+    return splits
+
+# --- Local Embedding Cache ---
+# Vectors are keyed by the SHA-256 of model name + chunk text, so re-runs only embed changed
+# chunks and switching models never reuses vectors from the old one
+def embedding_cache_key(doc):
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\0{doc.page_content}".encode("utf-8")).digest()
+
+def vector_id(doc):
+    """Position-based Pinecone ID, so an edited chunk overwrites its old version in place."""
+    return f"{doc.metadata.get('source')}#{doc.metadata.get('start_index')}"
+
+def open_embedding_cache(path=EMBEDDING_CACHE_PATH):
+    cache = sqlite3.connect(path)
+    cache.execute("CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+    return cache
+
+def lookup_embeddings(cache, hashes):
+    found = {}
+    # Stay under SQLite's default limit on bound parameters
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        rows = cache.execute(
+            f"SELECT hash, vec FROM embeddings WHERE hash IN ({','.join('?' * len(chunk))})", chunk
+        )
+        found.update((h, np.frombuffer(vec, dtype=np.float32).tolist()) for h, vec in rows)
+    return found
+
+def store_embeddings(cache, vectors_by_hash):
+    cache.executemany(
+        "INSERT OR REPLACE INTO embeddings (hash, vec) VALUES (?, ?)",
+        [(h, np.asarray(vector, dtype=np.float32).tobytes()) for h, vector in vectors_by_hash.items()]
     )
-    print(f"Waiting for index '{INDEX_NAME}' to be ready...")
-    while not pc.describe_index(INDEX_NAME).status['ready']:
-        time.sleep(5)
-    print(f"Index '{INDEX_NAME}' is ready.")
-else:
-    print(f"Index '{INDEX_NAME}' already exists.")
+    cache.commit()
 
-# --- Initialize Pinecone Vector Store ---
-index = pc.Index(INDEX_NAME)
-vector_store = PineconeVectorStore(embedding=embeddings, index=index)
+# --- Embedding & Upload ---
+async def embed_batch(batch, cache):
+    """Embed a slice of documents in a single API call, reusing cached vectors, and build Pinecone vectors."""
+    hashes = [embedding_cache_key(doc) for doc in batch]
+    vectors_by_hash = lookup_embeddings(cache, hashes)
+    missing = [(doc, h) for doc, h in zip(batch, hashes) if h not in vectors_by_hash]
+    if missing:
+        new_vectors = await embeddings.aembed_documents([doc.page_content for doc, _ in missing])
+        new_by_hash = {h: vector for (_, h), vector in zip(missing, new_vectors)}
+        store_embeddings(cache, new_by_hash)
+        vectors_by_hash.update(new_by_hash)
+    print(f"Embedded {len(missing)} chunks, reused {len(batch) - len(missing)} from cache.")
+    return [
+        {
+            "id": vector_id(doc),
+            "values": vectors_by_hash[h],
+            # Same layout PineconeVectorStore uses, so main.py can read these back
+            "metadata": {**doc.metadata, "text": doc.page_content},
+        }
+        for doc, h in zip(batch, hashes)
+    ]
 
-print("Pinecone Index Stats:", index.describe_index_stats())
-print("Langchain PineconeVectorStore initialized:", vector_store)
+async def upsert_batch(grpc_index, semaphore, vectors):
+    async with semaphore:
+        # async_req returns a concurrent future, awaited here without blocking the loop
+        await asyncio.wrap_future(grpc_index.upsert(vectors=vectors, async_req=True))
 
-# --- Folder containing the .txt files ---
-folder_path = r"C:\Users\alokm\OneDrive\Documents\Machine Learning\Assignment\HR Chatbot\Data\Pages_Text"
+async def embed_and_upsert(batch, grpc_index, semaphore, cache):
+    vectors = await embed_batch(batch, cache)
+    await asyncio.gather(*(
+        upsert_batch(grpc_index, semaphore, vectors[i:i + UPSERT_BATCH_SIZE])
+        for i in range(0, len(vectors), UPSERT_BATCH_SIZE)
+    ))
+    return [vector["id"] for vector in vectors]
+
+def delete_stale_vectors(grpc_index, upserted_ids):
+    """Delete chunks of the re-ingested sources that this run did not write, e.g. after a page shrank."""
+    # Serverless indexes can't delete by metadata filter, so list each source's IDs by prefix
+    sources = {upserted_id.rsplit("#", 1)[0] for upserted_id in upserted_ids}
+    stale_ids = [
+        existing_id
+        for source in sources
+        for page in grpc_index.list(prefix=f"{source}#")
+        for existing_id in page
+        if existing_id not in upserted_ids
+    ]
+    for i in range(0, len(stale_ids), DELETE_BATCH_SIZE):
+        grpc_index.delete(ids=stale_ids[i:i + DELETE_BATCH_SIZE])
+    return len(stale_ids)
+
+# --- Ingestion Pipeline ---
+async def produce_splits(file_paths, queue):
+    """Split files in a process pool and queue each file's chunks as soon as it is done."""
+    loop = asyncio.get_running_loop()
+
+    async def split_in_pool(pool, file_path):
+        return file_path, await loop.run_in_executor(pool, split_file, file_path)
+
+    # No point starting more worker processes than there are files
+    max_workers = max(1, min(os.cpu_count() or 1, len(file_paths)))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_text_splitter) as pool:
+        for next_done in asyncio.as_completed([split_in_pool(pool, path) for path in file_paths]):
+            file_path, splits = await next_done
+            print(f"Split {os.path.basename(file_path)} into {len(splits)} chunks.")
+            await queue.put(splits)
+    await queue.put(None)
+
+async def consume_splits(queue, grpc_index, cache):
+    """Group queued chunks into embedding batches and upload them while splitting continues."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPSERTS)
+    tasks = []
+    pending = []
+    while (splits := await queue.get()) is not None:
+        pending.extend(splits)
+        while len(pending) >= EMBED_BATCH_SIZE:
+            batch, pending = pending[:EMBED_BATCH_SIZE], pending[EMBED_BATCH_SIZE:]
+            tasks.append(asyncio.create_task(embed_and_upsert(batch, grpc_index, semaphore, cache)))
+    if pending:
+        tasks.append(asyncio.create_task(embed_and_upsert(pending, grpc_index, semaphore, cache)))
+    return {upserted_id for ids in await asyncio.gather(*tasks) for upserted_id in ids}
+
+async def ingest(file_paths, index_host):
+    queue = asyncio.Queue()
+    cache = open_embedding_cache()
+    # gRPC data-plane client: lower per-batch overhead than REST and supports parallel upserts
+    grpc_index = PineconeGRPC(api_key=settings.pinecone_api_key).Index(host=index_host)
+    try:
+        _, upserted_ids = await asyncio.gather(
+            produce_splits(file_paths, queue),
+            consume_splits(queue, grpc_index, cache)
+        )
+    finally:
+        cache.close()
+    # Only reached if every upsert succeeded, so a failed run never deletes live chunks
+    removed = await asyncio.to_thread(delete_stale_vectors, grpc_index, upserted_ids)
+    print(f"Removed {removed} stale chunks.")
+    return len(upserted_ids)
+
+if __name__ == "__main__":
+    # --- Initialize Pinecone ---
+    pc = Pinecone(api_key=settings.pinecone_api_key)
+
+    # Check if the index exists
+    if INDEX_NAME not in pc.list_indexes().names():
+        print(f"Index '{INDEX_NAME}' does not exist. Creating it now...")
+        spec = ServerlessSpec(
+            cloud="aws",
+            region="us-east-1"
+        )
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=EMBEDDING_DIMENSION,
+            metric="cosine",
+            spec=spec
+        )
+        print(f"Waiting for index '{INDEX_NAME}' to be ready...")
+        while not pc.describe_index(INDEX_NAME).status['ready']:
+            time.sleep(5)
+        print(f"Index '{INDEX_NAME}' is ready.")
+    else:
+        print(f"Index '{INDEX_NAME}' already exists.")
+
+    # --- Initialize Pinecone Vector Store ---
+    index = pc.Index(INDEX_NAME)
+    vector_store = PineconeVectorStore(embedding=embeddings, index=index)
+
+    print("Pinecone Index Stats:", index.describe_index_stats())
+    print("Langchain PineconeVectorStore initialized:", vector_store)
+
+    # --- Split, embed and upload every txt file ---
+    file_paths = [
+        os.path.join(folder_path, filename)
+        for filename in os.listdir(folder_path)
+        if filename.endswith(".txt")
+    ]
+    print(f"\nProcessing {len(file_paths)} files from {folder_path} ...")
 
-# --- Text Splitter ---
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-    add_start_index=True,
-)
-
-# --- Process each txt file and upload one by one ---
-for filename in os.listdir(folder_path):
-    if filename.endswith(".txt"):
-        file_path = os.path.join(folder_path, filename)
-        print(f"\nLoading {file_path} ...")
-        loader = TextLoader(file_path, encoding="utf-8")  # UTF-8 encoding for Korean text
-        docs = loader.load()
-        splits = text_splitter.split_documents(docs)
-        print(f"Split into {len(splits)} chunks.")
-
-        print(f"Adding chunks from {filename} to Pinecone Vector Store...")
-        try:
-            document_ids = vector_store.add_documents(documents=splits)
-            print(f"Successfully added {len(splits)} chunks from {filename}.")
-        except Exception as e:
-            print(f"Error adding {filename} to Pinecone Vector Store: {e}")
\ No newline at end of file
+    try:
+        uploaded = asyncio.run(ingest(file_paths, pc.describe_index(INDEX_NAME).host))
+        print(f"Successfully added {uploaded} chunks.")
+    except Exception as e:
+        print(f"Error adding chunks to Pinecone Vector Store: {e}")
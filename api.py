@@ -1,19 +1,20 @@
-import os
+import json
+import time
 import uuid
 import redis
+import asyncio
+import secrets
 import traceback
-from dotenv import load_dotenv
+from datetime import date
+from typing import List, Optional, Tuple
 from langchain_core.messages import AIMessage
-from fastapi import FastAPI, HTTPException, Body
-from langchain_community.chat_message_histories import RedisChatMessageHistory
-from main import ChatResponse, ChatRequest, llm, redis_client_utility, conversation_runnable_with_history
+from fastapi import FastAPI, HTTPException, Body, Request
+from fastapi.responses import StreamingResponse
+from config import settings, request_today
+from main import ChatResponse, ChatRequest, llm, redis_client_utility, conversation_runnable_with_history, astream_chat_tokens
 
-# --- Load environment variables ---
-load_dotenv()
-
-REDIS_URL = os.getenv("REDIS_URL")
-REDIS_CHAT_HISTORY_KEY_PREFIX = os.getenv("REDIS_CHAT_HISTORY_KEY_PREFIX")
-REDIS_CHAT_HISTORY_TTL_SECONDS = int(os.getenv("REDIS_CHAT_HISTORY_TTL_SECONDS"))
+CHAT_INFLIGHT_WINDOW_SECONDS = 60  # In-flight entries older than this are treated as abandoned
+CHAT_INFLIGHT_KEY_PREFIX = "chat-inflight:"
 
 # --- Initialize FastAPI App ---
 app = FastAPI(
@@ -22,21 +23,84 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# --- API Endpoint ---
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest = Body(...)):
+# --- Concurrent Request Limiter ---
+# Drops stale entries from every key, then admits the request only if all keys are under the limit
+_acquire_chat_slot_script = redis_client_utility.register_script("""
+    for _, key in ipairs(KEYS) do
+        redis.call('ZREMRANGEBYSCORE', key, '-inf', ARGV[1] - ARGV[2])
+        if redis.call('ZCARD', key) >= tonumber(ARGV[3]) then
+            return 0
+        end
+    end
+    for _, key in ipairs(KEYS) do
+        redis.call('ZADD', key, ARGV[1], ARGV[4])
+        redis.call('EXPIRE', key, ARGV[2])
+    end
+    return 1
+""") if redis_client_utility else None
+
+async def acquire_chat_slot(limiter_keys: List[str]) -> Optional[str]:
+    """Reserve an in-flight slot under every limiter key, returning its request id or None if a limit is reached."""
+    request_id = secrets.token_hex(4)
+    acquired = await asyncio.to_thread(
+        _acquire_chat_slot_script,
+        keys=[f"{CHAT_INFLIGHT_KEY_PREFIX}{key}" for key in limiter_keys],
+        args=[time.time(), CHAT_INFLIGHT_WINDOW_SECONDS, settings.chat_max_concurrent_requests, request_id]
+    )
+    return request_id if acquired else None
+
+def _release_chat_slot(limiter_keys: List[str], request_id: str) -> None:
+    pipe = redis_client_utility.pipeline(transaction=False)
+    for key in limiter_keys:
+        pipe.zrem(f"{CHAT_INFLIGHT_KEY_PREFIX}{key}", request_id)
+    pipe.execute()
+
+async def release_chat_slot(limiter_keys: List[str], request_id: str) -> None:
+    try:
+        await asyncio.to_thread(_release_chat_slot, limiter_keys, request_id)
+    except redis.exceptions.RedisError as e:
+        # The entries age out of the window anyway, so don't mask the response
+        print(f"Failed to release chat slot for {limiter_keys}: {e}")
+
+async def begin_chat(request: ChatRequest, http_request: Request) -> Tuple[str, List[str], str]:
+    """Check service availability and reserve a slot, returning (session_id, limiter_keys, request_id)."""
     if not llm:
         raise HTTPException(status_code=503, detail="LLM service is unavailable.")
-    if not REDIS_URL:
+    if not settings.redis_url:
         raise HTTPException(status_code=503, detail="Redis service is unavailable.")
     if not conversation_runnable_with_history:
          raise HTTPException(status_code=503, detail="Conversation runnable not initialized.")
 
     session_id_to_use = request.session_id or str(uuid.uuid4())
+    # session_id is client-supplied, so the client address is always limited; the session limit is extra
+    limiter_keys = [f"client:{http_request.client.host if http_request.client else 'unknown'}"]
+    if request.session_id:
+        limiter_keys.append(f"session:{request.session_id}")
+
+    try:
+        request_id = await acquire_chat_slot(limiter_keys)
+    except redis.exceptions.RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Chat history service error: {str(e)}")
+    if request_id is None:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many concurrent requests.",
+            headers={"Retry-After": "1"}
+        )
+
+    # Tools read this through config.request_date(), so one chat turn never straddles midnight.
+    # Each request runs in its own task context, which the streaming task also inherits
+    request_today.set(date.today())
+    return session_id_to_use, limiter_keys, request_id
+
+# --- API Endpoint ---
+@app.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(http_request: Request, request: ChatRequest = Body(...)):
+    session_id_to_use, limiter_keys, request_id = await begin_chat(request, http_request)
 
     try:
         # Agent returns a dict with 'output' key
-        result = conversation_runnable_with_history.invoke(
+        result = await conversation_runnable_with_history.ainvoke(
             input={"input": request.query},
             config={"configurable": {"session_id": session_id_to_use}}
         )
@@ -67,6 +131,49 @@ async def chat_endpoint(request: ChatRequest = Body(...)):
         print(f"Error during conversation: {type(e).__name__} - {e}")
         print(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Error during conversation: {str(e)}")
+    finally:
+        await release_chat_slot(limiter_keys, request_id)
+
+# --- Streaming API Endpoint ---
+class ChatStreamResponse(StreamingResponse):
+    """StreamingResponse that releases its chat slot however the stream ends."""
+
+    def __init__(self, content, limiter_keys: List[str], request_id: str, **kwargs):
+        super().__init__(content, **kwargs)
+        self.limiter_keys = limiter_keys
+        self.request_id = request_id
+
+    async def __call__(self, scope, receive, send):
+        # A finally block inside the generator never runs if the client disconnects before
+        # streaming starts, and background tasks are skipped on ClientDisconnect
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Shielded so a cancelled stream still frees its slot
+            await asyncio.shield(release_chat_slot(self.limiter_keys, self.request_id))
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(http_request: Request, request: ChatRequest = Body(...)):
+    session_id_to_use, limiter_keys, request_id = await begin_chat(request, http_request)
+
+    async def event_stream():
+        try:
+            async for token in astream_chat_tokens(request.query, session_id_to_use):
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            yield "data: [DONE]\n\n"
+        except Exception as e:
+            # Headers are already sent, so report failures in-band
+            print(f"Error during streamed conversation: {type(e).__name__} - {e}")
+            print(f"Traceback: {traceback.format_exc()}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return ChatStreamResponse(
+        event_stream(),
+        limiter_keys=limiter_keys,
+        request_id=request_id,
+        media_type="text/event-stream",
+        headers={"X-Session-ID": session_id_to_use}
+    )
 
 # --- Health Check Endpoint ---
 @app.get("/health")
@@ -75,9 +182,9 @@ async def health_check():
     redis_ok = False
     redis_reason = "Redis not configured or initial connection failed."
 
-    if REDIS_URL and redis_client_utility:
+    if settings.redis_url and redis_client_utility:
         try:
-            if redis_client_utility.ping():
+            if await asyncio.to_thread(redis_client_utility.ping):
                 redis_ok = True
                 redis_reason = "Connected successfully."
             else:
@@ -105,22 +212,14 @@ async def health_check():
 
 @app.delete("/chat_history/{session_id}")
 async def clear_chat_history_endpoint(session_id: str):
-    if not REDIS_URL or not redis_client_utility:
+    if not settings.redis_url or not redis_client_utility:
         raise HTTPException(status_code=503, detail="Redis service not configured or unavailable.")
     
-    key_to_check = f"{REDIS_CHAT_HISTORY_KEY_PREFIX}{session_id}"
+    key_to_check = f"{settings.redis_chat_history_key_prefix}{session_id}"
 
     try:
-        if redis_client_utility.exists(key_to_check):
-            history_to_clear = RedisChatMessageHistory(
-                session_id=session_id,
-                url=REDIS_URL,
-                key_prefix=REDIS_CHAT_HISTORY_KEY_PREFIX
-            )
-            history_to_clear.clear()
-            return {"message": f"Chat history for session {session_id} cleared."}
-        else:
-            raise HTTPException(status_code=404, detail="Session ID not found in chat history.")
+        # DEL reports how many keys it removed, so existence check and delete are one atomic round trip
+        deleted = await asyncio.to_thread(redis_client_utility.delete, key_to_check)
     except redis.exceptions.ConnectionError as e:
         print(f"Redis connection error while clearing history for session {session_id}: {e}")
         print(traceback.format_exc())
@@ -130,6 +229,10 @@ async def clear_chat_history_endpoint(session_id: str):
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error interacting with Redis: {str(e)}")
 
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Session ID not found in chat history.")
+    return {"message": f"Chat history for session {session_id} cleared."}
+
 # --- Run Instructions ---
 # 1. Set up environment variables in .env file:
 #    - REDIS_URL
@@ -151,4 +254,7 @@ async def clear_chat_history_endpoint(session_id: str):
 # Example usage with curl:
 #
 # 1. Ask about current date:
-#    curl -X POST "http://127.0.0.1:8000/chat" -H "Content-Type: application/json" -d '{"query": "What is todays date?"}'
\ No newline at end of file
+#    curl -X POST "http://127.0.0.1:8000/chat" -H "Content-Type: application/json" -d '{"query": "What is todays date?"}'
+#
+# 2. Stream the answer token by token:
+#    curl -N -X POST "http://127.0.0.1:8000/chat/stream" -H "Content-Type: application/json" -d '{"query": "What is the leave policy?"}'
\ No newline at end of file
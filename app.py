@@ -1,6 +1,8 @@
 import uuid
+import asyncio
+import threading
 import streamlit as st
-from main import conversation_runnable_with_history, llm
+from main import conversation_runnable_with_history, llm, astream_chat_tokens
 
 st.set_page_config(
     page_title="HR Chatbot Assistant",
@@ -11,6 +13,27 @@ st.set_page_config(
 st.title("🤖 HR Chatbot with Agentic AI")
 st.markdown("Ask me about HR policies, holidays, leave rules, and more!")
 
+# Holiday tools are async, so agent calls run on one long-lived background event loop
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def stream_response(prompt: str):
+    """Bridge the async token stream from the background loop into a sync generator for st.write_stream."""
+    loop = get_event_loop()
+    tokens = astream_chat_tokens(prompt, st.session_state.session_id)
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(tokens.__anext__(), loop).result()
+            except StopAsyncIteration:
+                break
+    finally:
+        # A Streamlit rerun abandons this generator mid-stream; close the async one on its loop too
+        asyncio.run_coroutine_threadsafe(tokens.aclose(), loop).result()
+
 # Initialize session state
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
@@ -78,33 +101,19 @@ if prompt := st.chat_input("Ask me about HR policies or holidays..."):
     
     # Get bot response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking... 🤔"):
-            try:
-                if not conversation_runnable_with_history:
-                    st.error("❌ Chatbot is not initialized. Please check your configuration.")
-                else:
-                    # Call the agent
-                    result = conversation_runnable_with_history.invoke(
-                        input={"input": prompt},
-                        config={"configurable": {"session_id": st.session_state.session_id}}
-                    )
-                    
-                    # Extract response
-                    if isinstance(result, dict) and 'output' in result:
-                        response = result['output']
-                    elif isinstance(result, str):
-                        response = result
-                    else:
-                        response = str(result)
-                    
-                    st.markdown(response)
-                    
-                    # Add assistant response to chat history
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                    
-            except Exception as e:
-                st.error(f"❌ Error: {str(e)}")
-                st.exception(e)
+        try:
+            if not conversation_runnable_with_history:
+                st.error("❌ Chatbot is not initialized. Please check your configuration.")
+            else:
+                # Render tokens as the agent generates them
+                response = st.write_stream(stream_response(prompt))
+                
+                # Add assistant response to chat history
+                st.session_state.messages.append({"role": "assistant", "content": response})
+                
+        except Exception as e:
+            st.error(f"❌ Error: {str(e)}")
+            st.exception(e)
 
                 
 # --- Run Instructions ---
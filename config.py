@@ -0,0 +1,46 @@
+import os
+from datetime import date
+from typing import Optional
+from contextvars import ContextVar
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+# --- Load environment variables ---
+load_dotenv()
+
+@dataclass(frozen=True)
+class Settings:
+    """Application configuration, read from the environment once at startup."""
+    google_api_key: Optional[str]
+    pinecone_api_key: Optional[str]
+    index_name: str
+    holiday_api_key: Optional[str]
+    redis_url: Optional[str]
+    redis_chat_history_key_prefix: Optional[str]
+    redis_chat_history_ttl_seconds: int
+    redis_chat_history_max_messages: int
+    chat_max_concurrent_requests: int
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            google_api_key=os.getenv("GOOGLE_API_KEY"),
+            pinecone_api_key=os.getenv("PINECONE_API_KEY"),
+            index_name=os.getenv("INDEX_NAME", "hr-vector-search-index"),
+            holiday_api_key=os.getenv("HOLIDAY_API_KEY"),
+            redis_url=os.getenv("REDIS_URL"),
+            redis_chat_history_key_prefix=os.getenv("REDIS_CHAT_HISTORY_KEY_PREFIX"),
+            redis_chat_history_ttl_seconds=int(os.getenv("REDIS_CHAT_HISTORY_TTL_SECONDS", 259_200)),  # 3 days
+            redis_chat_history_max_messages=int(os.getenv("REDIS_CHAT_HISTORY_MAX_MESSAGES", 20)),
+            chat_max_concurrent_requests=int(os.getenv("CHAT_MAX_CONCURRENT_REQUESTS", 3)),
+        )
+
+settings = Settings.from_env()
+
+# --- Request-scoped date ---
+# The API pins this per request so every tool in one chat turn sees the same date
+request_today: ContextVar[Optional[date]] = ContextVar("request_today", default=None)
+
+def request_date() -> date:
+    """Return the date pinned for the current request, or the system date outside a request."""
+    return request_today.get() or date.today()
@@ -1,14 +1,17 @@
-import os
-from typing import List, Optional
+import json
+from typing import AsyncIterator, List, Optional
 
 import redis
+import numpy as np
 from pinecone import Pinecone
-from dotenv import load_dotenv
+from cachetools import LRUCache, TTLCache
 from pydantic import BaseModel
+from config import settings
 from utils import get_all_tools
+from policy_categories import classify_policy_query
 
-from langchain.tools import Tool
-from langchain_core.messages import AIMessage
+from langchain.tools import StructuredTool
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict
 from langchain_core.documents import Document
 from langchain_pinecone import PineconeVectorStore
 from langchain.agents import AgentExecutor, create_tool_calling_agent
@@ -17,28 +20,41 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_community.chat_message_histories import RedisChatMessageHistory
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 
-# --- Load environment variables ---
-load_dotenv()
+pc = Pinecone(api_key=settings.pinecone_api_key)
+index = pc.Index(settings.index_name)
 
-REDIS_URL = os.getenv("REDIS_URL")
-REDIS_CHAT_HISTORY_KEY_PREFIX = os.getenv("REDIS_CHAT_HISTORY_KEY_PREFIX")
-REDIS_CHAT_HISTORY_TTL_SECONDS = int(os.getenv("REDIS_CHAT_HISTORY_TTL_SECONDS"))
-HOLIDAY_API_KEY = os.getenv("HOLIDAY_API_KEY")
+# --- Query Embedding Cache ---
+# Vectors are held as float32 arrays: lossless, and ~8x smaller than a list of Python floats
+_query_embedding_cache: LRUCache = LRUCache(maxsize=4096)
 
-pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))
-index = pc.Index(os.getenv("INDEX_NAME"))
+class CachedEmbeddings(GoogleGenerativeAIEmbeddings):
+    """GoogleGenerativeAIEmbeddings that memoizes query vectors by normalized query text."""
+
+    def embed_query(self, text: str, **kwargs) -> List[float]:
+        key = text.strip().lower()
+        if key not in _query_embedding_cache:
+            _query_embedding_cache[key] = np.asarray(super().embed_query(text, **kwargs), dtype=np.float32)
+        return _query_embedding_cache[key].tolist()
+
+    async def aembed_query(self, text: str, **kwargs) -> List[float]:
+        key = text.strip().lower()
+        if key not in _query_embedding_cache:
+            _query_embedding_cache[key] = np.asarray(await super().aembed_query(text, **kwargs), dtype=np.float32)
+        return _query_embedding_cache[key].tolist()
 
 # --- LLM Initialization ---
 llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-exp", temperature=0.7)
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+embeddings = CachedEmbeddings(model="models/text-embedding-004")
 vector_store = PineconeVectorStore(embedding=embeddings, index=index)
 
 # --- Redis Initialization ---
+# One pooled client is shared by chat history and the API endpoints
 redis_client_utility: Optional[redis.Redis] = None
 
 try:
-    if REDIS_URL:
-        redis_client_utility = redis.from_url(REDIS_URL)
+    if settings.redis_url:
+        _redis_pool = redis.ConnectionPool.from_url(settings.redis_url, max_connections=64)
+        redis_client_utility = redis.Redis(connection_pool=_redis_pool)
         redis_client_utility.ping()
         print("Redis connection successful!")
 except Exception as e:
@@ -54,6 +70,34 @@ class ChatResponse(BaseModel):
     response: str
     session_id: str
 
+# --- Chat History backed by the shared Redis client ---
+class PooledRedisChatMessageHistory(RedisChatMessageHistory):
+    """RedisChatMessageHistory that reuses an existing client instead of opening its own."""
+
+    def __init__(self, session_id: str, client: redis.Redis, key_prefix: str, ttl: Optional[int] = None):
+        # The parent __init__ always builds a new client from a URL, so set its attributes directly
+        self.redis_client = client
+        self.session_id = session_id
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+
+    def add_message(self, message: BaseMessage) -> None:
+        # Push, trim to the newest messages and refresh the TTL in one round trip
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.lpush(self.key, json.dumps(message_to_dict(message)))
+        pipe.ltrim(self.key, 0, settings.redis_chat_history_max_messages - 1)
+        if self.ttl:
+            pipe.expire(self.key, self.ttl)
+        pipe.execute()
+
+def get_redis_session_history(session_id: str) -> RedisChatMessageHistory:
+    return PooledRedisChatMessageHistory(
+        session_id=session_id,
+        client=redis_client_utility,
+        key_prefix=settings.redis_chat_history_key_prefix,
+        ttl=settings.redis_chat_history_ttl_seconds
+    )
+
 # --- Helper function to format retrieved documents ---
 def format_docs(docs: List[Document]) -> str:
     if not docs:
@@ -61,7 +105,13 @@ def format_docs(docs: List[Document]) -> str:
     return "\n\n".join(doc.page_content for doc in docs)
 
 # --- RAG Tool for Policy Retrieval ---
-def search_hr_policies(query: str) -> str:
+POLICY_SEARCH_K = 3
+POLICY_FILTER_MIN_SCORE = 0.6  # Cosine similarity a category-filtered hit needs to be trusted
+
+# Users often repeat the same policy question, so keep recent results keyed by normalized query
+_policy_search_cache: TTLCache = TTLCache(maxsize=512, ttl=3600)
+
+async def search_hr_policies(query: str) -> str:
     """
     Search the HR policy knowledge base for relevant information.
     
@@ -71,47 +121,46 @@ def search_hr_policies(query: str) -> str:
     Returns:
         str: Relevant policy information
     """
+    cache_key = query.strip().lower()
+    if cache_key in _policy_search_cache:
+        return _policy_search_cache[cache_key]
+    
     try:
-        retriever = vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={'k': 3}
-        )
-        docs = retriever.invoke(query)
-        return format_docs(docs)
+        category = classify_policy_query(query)
+        docs = []
+        if category:
+            # Search only that section; fall back below if it has nothing convincing, since a
+            # keyword can be misleading ("leave early" is attendance)
+            results = await vector_store.asimilarity_search_with_score(
+                query, k=POLICY_SEARCH_K, filter={"category": category}
+            )
+            if results and results[0][1] >= POLICY_FILTER_MIN_SCORE:
+                docs = [doc for doc, _ in results]
+        if not docs:
+            # The query embedding is cached, so the fallback only costs the Pinecone query
+            docs = await vector_store.asimilarity_search(query, k=POLICY_SEARCH_K)
     except Exception as e:
         return f"Error searching policies: {str(e)}"
+    
+    result = format_docs(docs)
+    _policy_search_cache[cache_key] = result
+    return result
 
 # Create RAG tool
-policy_search_tool = Tool(
+policy_search_tool = StructuredTool.from_function(
     name="search_hr_policies",
-    func=search_hr_policies,
-    description="Search the HR policy knowledge base for information about company policies, leave policies, benefits, procedures, and guidelines. Use this when the user asks about HR policies, leave rules, company procedures, or any policy-related questions."
+    coroutine=search_hr_policies,
+    description="Searches the HR policy knowledge base for policies, leave rules, benefits and procedures."
 )
 
 # --- Agent Prompt Template ---
-agent_prompt_template_str = """
-    You are an advanced HR policy assistant with access to multiple tools. Your role is to:
-
-    1. Answer HR policy questions using the policy knowledge base
-    2. Provide current date and holiday information when asked
-    3. Help HR professionals with policy interpretation and compliance
-
-    **Decision Making Process:**
-    - For questions about HR policies, procedures, leave rules, benefits → Use the 'search_hr_policies' tool
-    - For questions about today's date, current date → Use the 'get_current_date' tool
-    - For questions about holidays, public holidays, holiday list → Use the 'check_holidays' tool
-    - For questions about whether today is a holiday → Use the 'check_today_holiday' tool
-    - For questions about upcoming holidays, next holidays → Use the 'get_upcoming_holidays' tool
-
-    **Important Guidelines:**
-    - Always think step-by-step before choosing a tool
-    - Use the most specific tool for the query
-    - If a question requires multiple tools, use them sequentially
-    - Always provide clear, professional, and accurate responses
-    - If information is not available, clearly state that and suggest alternatives
-    - Cite specific policies when using information from the knowledge base
-
-    Be helpful, accurate, and professional in all interactions.
+agent_prompt_template_str = """You are an HR policy assistant. Pick the most specific tool for each question:
+- HR policies, leave rules, benefits, procedures -> search_hr_policies
+- today's date -> get_current_date
+- holiday list -> check_holidays
+- is today a holiday -> check_today_holiday
+- upcoming holidays -> get_upcoming_holidays
+Chain tools when needed. Answer clearly and professionally, cite the policy you used, and say so if information is unavailable.
 """
 
 agent_prompt = ChatPromptTemplate.from_messages([
@@ -124,9 +173,9 @@ agent_prompt = ChatPromptTemplate.from_messages([
 # --- Initialize Agent ---
 conversation_runnable_with_history: Optional[RunnableWithMessageHistory] = None
 
-if llm and REDIS_URL:
+if llm and redis_client_utility:
     # Get all tools
-    all_tools = get_all_tools() + [policy_search_tool]
+    all_tools = get_all_tools() + (policy_search_tool,)
     
     # Create agent
     agent = create_tool_calling_agent(llm, all_tools, agent_prompt)
@@ -142,14 +191,6 @@ if llm and REDIS_URL:
     for tool in all_tools:
         print(f"  - {tool.name}: {tool.description[:60]}...")
     
-    def get_redis_session_history(session_id: str) -> RedisChatMessageHistory:
-        return RedisChatMessageHistory(
-            session_id=session_id,
-            url=REDIS_URL,
-            key_prefix=REDIS_CHAT_HISTORY_KEY_PREFIX,
-            ttl=REDIS_CHAT_HISTORY_TTL_SECONDS
-        )
-    
     conversation_runnable_with_history = RunnableWithMessageHistory(
         runnable=agent_executor,
         get_session_history=get_redis_session_history,
@@ -160,6 +201,20 @@ if llm and REDIS_URL:
 else:
     if not llm:
         print("CRITICAL: LLM not initialized. Conversation runnable cannot be created.")
-    if not REDIS_URL:
+    if not redis_client_utility:
         print("CRITICAL: Redis not configured or unavailable. Conversation runnable cannot be created.")
-    conversation_runnable_with_history = None
\ No newline at end of file
+    conversation_runnable_with_history = None
+
+# --- Token Streaming ---
+async def astream_chat_tokens(query: str, session_id: str) -> AsyncIterator[str]:
+    """Yield the agent's LLM output tokens as they are generated."""
+    async for event in conversation_runnable_with_history.astream_events(
+        {"input": query},
+        config={"configurable": {"session_id": session_id}},
+        version="v2"
+    ):
+        if event["event"] == "on_chat_model_stream":
+            content = event["data"]["chunk"].content
+            # Tool-call chunks carry no text content
+            if isinstance(content, str) and content:
+                yield content
@@ -0,0 +1,70 @@
+import os
+import re
+from typing import Optional
+
+# Policy sections from the HR manual index (page 4): category -> (page range, query keywords)
+POLICY_CATEGORIES = {
+    "attendance": ((9, 11), ("attendance", "working hours", "office hours", "late coming")),
+    "conduct": ((12, 18), ("conduct", "harass", "posh", "arm's length", "disciplin")),
+    "recruitment": ((19, 20), ("recruit", "hire", "hiring")),
+    "induction": ((21, 22), ("induction", "onboard")),
+    "probation": ((23, 24), ("probation", "confirmation")),
+    "leave": ((25, 30), ("leave", "vacation", "maternity", "paternity")),
+    "performance": ((31, 38), ("performance", "appraisal", "promotion")),
+    "learning": ((39, 41), ("training", "learning")),
+    "compensation": ((42, 45), ("salar", "compensation", "increment", "allowance")),
+    "equipment": ((46, 48), ("laptop", "data card", "mobile")),
+    "travel": ((49, 51), ("travel", "tour", "per diem")),
+    "conveyance": ((52, 53), ("conveyance", "taxi")),
+    "welfare": ((54, 55), ("welfare", "insurance", "medical")),
+    "grievance": ((56, 58), ("grievance", "complaint")),
+    "separation": ((59, 61), ("exit", "separation", "resign", "notice period", "retir")),
+    "wfh": ((62, 63), ("work from home", "wfh", "pandemic", "remote")),
+}
+
+# Keywords are word-start stems, so "recruit" covers "recruiting"/"recruited" while
+# "tour" does not match "contours"
+_KEYWORD_PATTERNS = {
+    category: re.compile(r"\b(?:" + "|".join(map(re.escape, keywords)) + r")\w*")
+    for category, (_, keywords) in POLICY_CATEGORIES.items()
+}
+
+def classify_policy_page(file_path: str) -> str:
+    """
+    Map a page_<n>.txt file to the policy section it belongs to.
+    
+    Args:
+        file_path: Path or name of the page file
+    
+    Returns:
+        str: Category name, or "general" for pages outside any policy section
+    """
+    match = re.search(r"page_(\d+)", os.path.basename(file_path))
+    if match:
+        page = int(match.group(1))
+        for category, ((first_page, last_page), _) in POLICY_CATEGORIES.items():
+            if first_page <= page <= last_page:
+                return category
+    return "general"
+
+def classify_policy_query(query: str) -> Optional[str]:
+    """
+    Pick the policy category whose keyword appears first in the query.
+    
+    The result is a best guess: callers should fall back to an unfiltered search when
+    the filtered one finds nothing convincing.
+    
+    Args:
+        query: The user's search query
+    
+    Returns:
+        str: Category name, or None if no keyword matches
+    """
+    query = query.lower()
+    # (position of first keyword hit, category); the earliest-mentioned topic wins
+    matches = [
+        (match.start(), category)
+        for category, pattern in _KEYWORD_PATTERNS.items()
+        if (match := pattern.search(query))
+    ]
+    return min(matches)[1] if matches else None
@@ -1,16 +1,24 @@
-import os
-import requests
-from datetime import date, datetime
-from typing import Dict, Any, Optional
-from langchain.tools import Tool
-from dotenv import load_dotenv
+import httpx
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from cachetools import TTLCache
+from langchain.tools import Tool, StructuredTool
+from config import settings, request_date
 
-# Load environment variables
-load_dotenv()
-
-HOLIDAY_API_KEY = os.getenv("HOLIDAY_API_KEY")
 HOLIDAY_API_BASE_URL = "https://calendarific.com/api/v2"
 
+# Shared async client so concurrent tool calls reuse pooled connections;
+# HTTP/2 multiplexes concurrent lookups over one TLS connection
+_http = httpx.AsyncClient(
+    http2=True,
+    timeout=10,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=300)
+)
+_http_version_logged = False
+
+# Holiday lists change at most once a day, so cache each (country, year) for 24h
+_holiday_cache: TTLCache = TTLCache(maxsize=256, ttl=86_400)
+
 def get_current_date(query: str = "") -> str:
     """
     Get the current date in a formatted string.
@@ -21,10 +29,63 @@ def get_current_date(query: str = "") -> str:
     Returns:
         str: Current date in format "YYYY-MM-DD (Day, Month DD, YYYY)"
     """
-    today = date.today()
+    today = request_date()
     return today.strftime("%Y-%m-%d (%A, %B %d, %Y)")
 
-def check_holidays(query: str = "", country_code: str = "IN", year: Optional[int] = None) -> str:
+class HolidayAPIError(Exception):
+    """Raised when Calendarific returns a non-200 meta code."""
+
+async def _get_year_holidays(country_code: str, year: int) -> List[Dict[str, Any]]:
+    """
+    Fetch all holidays for a country and year, served from the TTL cache when possible.
+    
+    Args:
+        country_code: ISO 3166-1 alpha-2 country code
+        year: Year to fetch holidays for
+    
+    Returns:
+        list: Holiday dicts as returned by Calendarific, each with a parsed "_parsed_date"
+    """
+    cache_key = (country_code, year)
+    if cache_key in _holiday_cache:
+        return _holiday_cache[cache_key]
+    
+    url = f"{HOLIDAY_API_BASE_URL}/holidays"
+    params = {
+        "api_key": settings.holiday_api_key,
+        "country": country_code,
+        "year": year
+    }
+    
+    response = await _http.get(url, params=params)
+    response.raise_for_status()
+    
+    global _http_version_logged
+    if not _http_version_logged:
+        print(f"Holiday API negotiated {response.http_version}")
+        _http_version_logged = True
+    
+    data = response.json()
+    
+    if data.get("meta", {}).get("code") != 200:
+        raise HolidayAPIError(f"API Error: {data.get('meta', {}).get('error_detail', 'Unknown error')}")
+    
+    # Parse each ISO date once here so callers only compare dates
+    holidays = []
+    for holiday in data.get("response", {}).get("holidays", []):
+        holiday_date_str = holiday.get("date", {}).get("iso", "")
+        try:
+            # Handle ISO format with or without time component
+            holiday["_parsed_date"] = datetime.strptime(holiday_date_str.split('T')[0], "%Y-%m-%d").date()
+        except ValueError:
+            # Skip holidays with missing or invalid date formats
+            continue
+        holidays.append(holiday)
+    
+    _holiday_cache[cache_key] = holidays
+    return holidays
+
+async def check_holidays(query: str = "", country_code: str = "IN", year: Optional[int] = None) -> str:
     """
     Check holidays for a specific country and year using Calendarific API.
     
@@ -36,29 +97,14 @@ def check_holidays(query: str = "", country_code: str = "IN", year: Optional[int
     Returns:
         str: Formatted string with holiday information or error message
     """
-    if not HOLIDAY_API_KEY:
+    if not settings.holiday_api_key:
         return "Holiday API key is not configured. Please set HOLIDAY_API_KEY in environment variables."
     
     if year is None:
-        year = date.today().year
+        year = request_date().year
     
     try:
-        url = f"{HOLIDAY_API_BASE_URL}/holidays"
-        params = {
-            "api_key": HOLIDAY_API_KEY,
-            "country": country_code,
-            "year": year
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if data.get("meta", {}).get("code") != 200:
-            return f"API Error: {data.get('meta', {}).get('error_detail', 'Unknown error')}"
-        
-        holidays = data.get("response", {}).get("holidays", [])
+        holidays = await _get_year_holidays(country_code, year)
         
         if not holidays:
             return f"No holidays found for {country_code} in {year}."
@@ -76,14 +122,16 @@ def check_holidays(query: str = "", country_code: str = "IN", year: Optional[int
         
         return result
         
-    except requests.exceptions.Timeout:
+    except HolidayAPIError as e:
+        return str(e)
+    except httpx.TimeoutException:
         return "Holiday API request timed out. Please try again later."
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return f"Error fetching holidays: {str(e)}"
     except Exception as e:
         return f"Unexpected error: {str(e)}"
 
-def check_today_holiday(query: str = "", country_code: str = "IN") -> str:
+async def check_today_holiday(query: str = "", country_code: str = "IN") -> str:
     """
     Check if today is a holiday in the specified country.
     
@@ -94,26 +142,16 @@ def check_today_holiday(query: str = "", country_code: str = "IN") -> str:
     Returns:
         str: Information about today's holiday status
     """
-    if not HOLIDAY_API_KEY:
+    if not settings.holiday_api_key:
         return "Holiday API key is not configured. Please set HOLIDAY_API_KEY in environment variables."
     
-    today = date.today()
+    today = request_date()
     
     try:
-        url = f"{HOLIDAY_API_BASE_URL}/holidays"
-        params = {
-            "api_key": HOLIDAY_API_KEY,
-            "country": country_code,
-            "year": today.year,
-            "month": today.month,
-            "day": today.day
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        holidays = data.get("response", {}).get("holidays", [])
+        holidays = [
+            holiday for holiday in await _get_year_holidays(country_code, today.year)
+            if holiday["_parsed_date"] == today
+        ]
         
         if holidays:
             result = f"Yes! Today ({today.strftime('%B %d, %Y')}) is a holiday:\n\n"
@@ -128,12 +166,12 @@ def check_today_holiday(query: str = "", country_code: str = "IN") -> str:
         else:
             return f"No, today ({today.strftime('%B %d, %Y')}) is not a holiday in {country_code}."
             
-    except requests.exceptions.RequestException as e:
+    except (HolidayAPIError, httpx.HTTPError) as e:
         return f"Error checking today's holiday: {str(e)}"
     except Exception as e:
         return f"Unexpected error: {str(e)}"
 
-def get_upcoming_holidays(query: str = "", country_code: str = "IN", limit: int = 5) -> str:
+async def get_upcoming_holidays(query: str = "", country_code: str = "IN", limit: int = 5) -> str:
     """
     Get upcoming holidays from today onwards.
     
@@ -145,47 +183,19 @@ def get_upcoming_holidays(query: str = "", country_code: str = "IN", limit: int
     Returns:
         str: Formatted string with upcoming holiday information
     """
-    if not HOLIDAY_API_KEY:
+    if not settings.holiday_api_key:
         return "Holiday API key is not configured. Please set HOLIDAY_API_KEY in environment variables."
     
-    today = date.today()
+    today = request_date()
     
     try:
-        url = f"{HOLIDAY_API_BASE_URL}/holidays"
-        params = {
-            "api_key": HOLIDAY_API_KEY,
-            "country": country_code,
-            "year": today.year
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        holidays = data.get("response", {}).get("holidays", [])
+        holidays = await _get_year_holidays(country_code, today.year)
         
-        # Filter upcoming holidays
-        upcoming = []
-        for holiday in holidays:
-            holiday_date_str = holiday.get("date", {}).get("iso", "")
-            if holiday_date_str:
-                try:
-                    # Handle ISO format with or without time component
-                    # Split on 'T' to get just the date part
-                    date_part = holiday_date_str.split('T')[0]
-                    holiday_date = datetime.strptime(date_part, "%Y-%m-%d").date()
-                    if holiday_date >= today:
-                        upcoming.append(holiday)
-                except ValueError:
-                    # Skip holidays with invalid date formats
-                    continue
+        upcoming = [holiday for holiday in holidays if holiday["_parsed_date"] >= today][:limit]
         
         if not upcoming:
             return f"No upcoming holidays found for {country_code} in {today.year}."
         
-        # Limit the results
-        upcoming = upcoming[:limit]
-        
         result = f"Upcoming holidays in {country_code}:\n\n"
         for holiday in upcoming:
             name = holiday.get("name", "Unknown")
@@ -202,25 +212,33 @@ def get_upcoming_holidays(query: str = "", country_code: str = "IN", limit: int
 date_tool = Tool(
     name="get_current_date",
     func=get_current_date,
-    description="Returns the current date. Use this when the user asks about today's date or what day it is."
+    description="Returns today's date."
 )
 
-holiday_checker_tool = Tool(
+holiday_checker_tool = StructuredTool.from_function(
     name="check_holidays",
-    func=check_holidays,
-    description="Fetches all holidays for India in the current year. Use this when the user asks about holidays, public holidays, or leave calendar."
+    coroutine=check_holidays,
+    description="Lists this year's public holidays in India."
 )
 
-today_holiday_tool = Tool(
+today_holiday_tool = StructuredTool.from_function(
     name="check_today_holiday",
-    func=check_today_holiday,
-    description="Checks if today is a holiday in India. Use this when the user asks if today is a holiday or what holiday is today."
+    coroutine=check_today_holiday,
+    description="Checks whether today is a holiday in India."
 )
 
-upcoming_holidays_tool = Tool(
+upcoming_holidays_tool = StructuredTool.from_function(
     name="get_upcoming_holidays",
-    func=get_upcoming_holidays,
-    description="Gets the next 5 upcoming holidays in India. Use this when the user asks about upcoming holidays or next holidays."
+    coroutine=get_upcoming_holidays,
+    description="Lists the next upcoming holidays in India."
+)
+
+# Built once at import; the tool set never changes at runtime
+_ALL_TOOLS = (
+    date_tool,
+    holiday_checker_tool,
+    today_holiday_tool,
+    upcoming_holidays_tool
 )
 
 # Function to be used in main.py for tool integration
@@ -229,11 +247,6 @@ def get_all_tools():
     Returns all available tools for the agent.
     
     Returns:
-        list: List of LangChain Tool objects
+        tuple: Immutable tuple of LangChain Tool objects
     """
-    return [
-        date_tool,
-        holiday_checker_tool,
-        today_holiday_tool,
-        upcoming_holidays_tool
-    ]
\ No newline at end of file
+    return _ALL_TOOLS
\ No newline at end of file